@@ -0,0 +1,213 @@
+import asyncio
+from collections import Counter
+
+import numpy as np
+
+
+class PredictionBatcher:
+	"""
+	Collects concurrent prediction requests into batches so that one
+	vectorized predict call serves many callers. A batch holds up to
+	max_batch_size rows and is scored once it is full, once the next
+	request would not fit, or once its first request has waited
+	max_delay_ms, whichever comes first; raising max_delay_ms trades
+	latency for larger batches and higher throughput. A single request
+	larger than max_batch_size is scored as a batch of its own.
+
+	Example:
+		scorer = load_model("model.lrm")
+		async with PredictionBatcher(scorer.predict, max_batch_size=512) as batcher:
+			y = await batcher.predict([[1.0, 2.0]])
+	"""
+
+	def __init__(self, predict_fn, max_batch_size=256, max_delay_ms=2.0, executor=None):
+		"""
+		Parameters:
+			predict_fn: a callable mapping an (n, p) array to n predictions,
+				e.g. LinearScorer.predict
+			max_batch_size: the most rows a batch holds
+			max_delay_ms: the longest a request waits for a batch to fill
+			executor: an optional concurrent.futures executor to run
+				predict_fn in, keeping the event loop free while scoring
+		"""
+
+		if max_batch_size < 1:
+			raise ValueError("max_batch_size must be positive")
+		if max_delay_ms < 0:
+			raise ValueError("max_delay_ms cannot be negative")
+
+		self.predict_fn = predict_fn
+		self.max_batch_size = max_batch_size
+		self.max_delay = max_delay_ms / 1000
+		self.executor = executor
+		self._queue = None
+		self._task = None
+		self._pending = None
+		self._closed = False
+
+		self.requests = 0
+		self.rows = 0
+		self.batches = 0
+		self.last_batch_size = 0
+		self.largest_batch_size = 0
+
+	async def __aenter__(self):
+		await self.start()
+		return self
+
+	async def __aexit__(self, *exc_info):
+		await self.close()
+
+	@property
+	def queue_depth(self):
+		"""The number of requests waiting to be batched."""
+
+		depth = self._queue.qsize() if self._queue is not None else 0
+		return depth + (self._pending is not None)
+
+	def metrics(self):
+		"""
+		Reports the batcher's counters.
+		Returns: a dict with the current queue depth, the request, row and
+			batch totals, and the last, largest and mean batch sizes in rows
+		"""
+
+		return {
+			"queue_depth": self.queue_depth,
+			"requests": self.requests,
+			"rows": self.rows,
+			"batches": self.batches,
+			"last_batch_size": self.last_batch_size,
+			"largest_batch_size": self.largest_batch_size,
+			"mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+		}
+
+	async def start(self):
+		"""Starts the background task that forms and scores batches."""
+
+		self._closed = False
+		if self._task is None:
+			self._queue = asyncio.Queue()
+			self._task = asyncio.get_running_loop().create_task(self._run())
+
+	async def close(self):
+		"""
+		Scores every request already queued, then stops the batcher.
+		Later predict calls raise RuntimeError until start is called again.
+		"""
+
+		self._closed = True
+		if self._task is not None:
+			await self._queue.put(None)
+			await self._task
+			self._task = None
+
+	async def predict(self, X):
+		"""
+		Queues rows for prediction and waits for their batch to be scored.
+		Parameters:
+			X: a 2D array-like of rows, or a 1D array-like holding one row
+		Returns: an array with one prediction per row of X
+		"""
+
+		if self._closed:
+			raise RuntimeError("batcher is closed")
+		await self.start()
+		X = np.atleast_2d(np.asarray(X, dtype=float))
+		if X.ndim != 2:
+			raise ValueError("X must be one or two dimensional")
+
+		future = asyncio.get_running_loop().create_future()
+		await self._queue.put((X, future))
+		return await future
+
+	async def _run(self):
+		loop = asyncio.get_running_loop()
+		running = True
+		while running:
+			if self._pending is not None:
+				request, self._pending = self._pending, None
+			else:
+				request = await self._queue.get()
+			if request is None:
+				break
+			batch = [request]
+			size = len(request[0])
+			deadline = loop.time() + self.max_delay
+
+			while size < self.max_batch_size:
+				try:
+					if self._queue.empty():
+						request = await asyncio.wait_for(self._queue.get(),
+														 deadline - loop.time())
+					else:
+						request = self._queue.get_nowait()
+				except asyncio.TimeoutError:
+					break
+				if request is None:
+					running = False
+					break
+				if size + len(request[0]) > self.max_batch_size:
+					# hold the request for the next batch rather than
+					# pushing this one over the cap
+					self._pending = request
+					break
+				batch.append(request)
+				size += len(request[0])
+
+			await self._score(batch)
+
+		# nothing should be queued behind the stop marker, but never leave
+		# a caller waiting on a batch that will not come
+		while not self._queue.empty():
+			request = self._queue.get_nowait()
+			if request is not None and not request[1].done():
+				request[1].set_exception(RuntimeError("batcher is closed"))
+
+	async def _score(self, batch):
+		"""
+		Scores one batch and hands each caller its slice of the results.
+		Requests whose column count differs from the batch's most common
+		one fail on their own rather than breaking the batch for everyone.
+		Parameters:
+			batch: a list of (rows, future) requests
+		"""
+
+		width = Counter(rows.shape[1] for rows, _ in batch).most_common(1)[0][0]
+		for rows, future in batch:
+			if rows.shape[1] != width and not future.done():
+				future.set_exception(ValueError(
+					f"expected {width} columns per row, got {rows.shape[1]}"))
+		batch = [(rows, future) for rows, future in batch if rows.shape[1] == width]
+		size = sum(len(rows) for rows, _ in batch)
+
+		self.requests += len(batch)
+		self.rows += size
+		self.batches += 1
+		self.last_batch_size = size
+		self.largest_batch_size = max(self.largest_batch_size, size)
+
+		try:
+			X = np.concatenate([rows for rows, _ in batch])
+			if self.executor is not None:
+				loop = asyncio.get_running_loop()
+				predicted_y = await loop.run_in_executor(self.executor, self.predict_fn, X)
+			else:
+				predicted_y = self.predict_fn(X)
+			predicted_y = np.asarray(predicted_y)
+			if len(predicted_y) != size:
+				raise ValueError("predict_fn must return one prediction per row")
+		except Exception as error:
+			# give every caller its own exception, chained to the cause, so
+			# callers do not share and extend one traceback
+			for _, future in batch:
+				if not future.done():
+					failure = RuntimeError("batch prediction failed")
+					failure.__cause__ = error
+					future.set_exception(failure)
+			return
+
+		offsets = np.cumsum([len(rows) for rows, _ in batch])[:-1]
+		for (_, future), result in zip(batch, np.split(predicted_y, offsets)):
+			if not future.done():
+				future.set_result(result)
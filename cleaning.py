@@ -3,6 +3,8 @@ import numpy as np
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import OneHotEncoder, LabelEncoder
 
+from sketch import QuantileSketch
+
 def fill_missing_values(df, numerical_strategy='mean', categorical_strategy='most_frequent', numeric_cols=None, cat_cols=None):
     """
     Fill missing values in numerical and categorical columns using specified strategies.
@@ -44,7 +46,31 @@ def fill_missing_values(df, numerical_strategy='mean', categorical_strategy='mos
 
     return df
 
-def remove_outliers_iqr(df, columns=None, multiplier=1.5):
+def iqr_bounds(values, multiplier=1.5):
+    """
+    Compute the lower and upper IQR outlier bounds of a numeric column.
+    
+    Parameters:
+    -----------
+    values : array-like or QuantileSketch
+        The column values, or a QuantileSketch built from them (e.g. on
+        streamed data) for approximate bounds.
+    multiplier : float, default=1.5
+        The IQR multiplier defining what is considered an outlier.
+    
+    Returns:
+    --------
+    tuple
+        The (lower_bound, upper_bound) pair.
+    """
+    if isinstance(values, QuantileSketch):
+        Q1, Q3 = values.quantile([0.25, 0.75])
+    else:
+        Q1, Q3 = pd.Series(values).quantile([0.25, 0.75])
+    IQR = Q3 - Q1
+    return Q1 - multiplier * IQR, Q3 + multiplier * IQR
+
+def remove_outliers_iqr(df, columns=None, multiplier=1.5, approximate=False, sketches=None, sketch_k=200):
     """
     Remove outliers from specified numeric columns using the IQR (Interquartile Range) method.
     
@@ -56,6 +82,14 @@ def remove_outliers_iqr(df, columns=None, multiplier=1.5):
         List of numeric columns to check for outliers. If None, all numeric columns are used.
     multiplier : float, default=1.5
         The IQR multiplier defining what is considered an outlier.
+    approximate : bool, default=False
+        If True, estimate Q1 and Q3 with a QuantileSketch instead of exact quantiles.
+    sketches : dict, optional
+        Mapping of column name to a prebuilt QuantileSketch (e.g. built from streamed
+        or training data). Bounds for these columns come from the sketch and are not
+        recomputed on df, so the same bounds can be reused at serving time.
+    sketch_k : int, default=200
+        Accuracy parameter for sketches built when approximate=True.
     
     Returns:
     --------
@@ -66,14 +100,18 @@ def remove_outliers_iqr(df, columns=None, multiplier=1.5):
 
     if columns is None:
         columns = df.select_dtypes(include=[np.number]).columns.tolist()
+    if sketches is None:
+        sketches = {}
 
     for col in columns:
         if df[col].dtype.kind in 'bifc':  # numeric types
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - multiplier * IQR
-            upper_bound = Q3 + multiplier * IQR
+            if col in sketches:
+                values = sketches[col]
+            elif approximate:
+                values = QuantileSketch(k=sketch_k).update(df[col].to_numpy())
+            else:
+                values = df[col]
+            lower_bound, upper_bound = iqr_bounds(values, multiplier)
             df = df[(df[col] >= lower_bound) & (df[col] <= upper_bound)]
 
     return df
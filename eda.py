@@ -1,5 +1,8 @@
 import numpy as np
 
+from sketch import QuantileSketch
+from validation import check_array
+
 def calculate_mean(x):
 	"""
 	Calculates the arithmetic mean of an iterable x.
@@ -8,11 +11,7 @@ def calculate_mean(x):
 	Returns: the mean of the input x as a float
 	"""
 
-	if len(x) == 0:
-		raise ValueError("Empty dataset")
-	for i in x:
-		if not isinstance(i, (int, float)):
-			raise TypeError("All elements must be numerical values")
+	x = check_array(x)
 
 	# print(np.mean(x))
 	# print(np.mean(y))
@@ -23,15 +22,16 @@ def calculate_median(x):
 	"""
 	Calculates and returns the median value of an iterable x.
 	Parameters:
-		x: an iterable of numerical values
+		x: an iterable of numerical values, or a QuantileSketch for an
+			approximate median of data that does not fit in memory
 	Returns: the median of the input x
 	"""
 
-	if len(x) == 0:
-		raise ValueError("Empty dataset")
-	for i in x:
-		if not isinstance(i, (int, float)):
-			raise TypeError("All elements must be numerical values")
+	if isinstance(x, QuantileSketch):
+		if x.count == 0:
+			raise ValueError("Empty dataset")
+		return x.quantile(0.5)
+	x = check_array(x)
 
 	# print(np.median(x))
 	# print(np.median(y))
@@ -46,11 +46,7 @@ def calculate_variance(x):
 	Returns: the variance of the input x as a float
 	"""
 
-	if len(x) == 0:
-		raise ValueError("Empty dataset")
-	for i in x:
-		if not isinstance(i, (int, float)):
-			raise TypeError("All elements must be numerical values")
+	x = check_array(x)
 
 	# print(np.var(x))
 	# print(np.var(y))
@@ -65,11 +61,7 @@ def calculate_std(x):
 	Returns: the standard deviation of the input x
 	"""
 
-	if len(x) == 0:
-		raise ValueError("Empty dataset")
-	for i in x:
-		if not isinstance(i, (int, float)):
-			raise TypeError("All elements must be numerical values")
+	x = check_array(x)
 
 	# print(np.std(x))
 	# print(np.std(y))
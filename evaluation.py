@@ -1,5 +1,12 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
 from eda import calculate_mean, calculate_variance
 from model import fit, predict
+from validation import check_array
 
 def calculate_mse(y, predicted_y):
 	"""
@@ -16,10 +23,10 @@ def calculate_mse(y, predicted_y):
 	if len(y) == 0 or len(predicted_y) == 0:
 		raise ValueError("inputs cannot be empty")
 
-	squared_errors = [(actual - predicted) ** 2 for actual, predicted\
-				   in zip(y, predicted_y)]
+	y = check_array(y, "y")
+	predicted_y = check_array(predicted_y, "predicted_y")
 
-	mse = sum(squared_errors) / len(y)
+	mse = float(np.mean((y - predicted_y) ** 2))
 
 	return mse
 
@@ -44,4 +51,254 @@ def calculate_r_squared(y, predicted_y):
 	r_squared = explained_variance / total_variance
 	
 	return r_squared
-	
\ No newline at end of file
+	
+
+# rows per block when casting bootstrap counts for the matrix product
+_BLOCK_ROWS = 65536
+
+# default worker cap: drawing counts holds the GIL, so beyond a few
+# threads extra workers add memory but little speed
+_MAX_WORKERS = 4
+
+
+def _design_matrix(X):
+	"""
+	Builds the design matrix used by the resampling routines: the
+	feature columns of X with a leading column of ones for the intercept.
+	Parameters:
+		X: an iterable of x values, or a 2D array of shape (n, p)
+	Returns: a float array of shape (n, p + 1)
+	"""
+
+	X = np.asarray(X, dtype=float)
+	if X.ndim == 1:
+		X = X[:, None]
+	if X.ndim != 2:
+		raise ValueError("X must be one or two dimensional")
+
+	return np.column_stack([np.ones(len(X)), X])
+
+
+def _bootstrap_batch(Z, p, n, n_resamples, seed):
+	"""
+	Draws one batch of resample weights and reduces it to per-resample
+	sufficient statistics.
+	Parameters:
+		Z: the (n, k) matrix of row-wise cross products
+		p: the number of columns of the design matrix
+		n: the number of rows
+		n_resamples: the number of resamples in this batch
+		seed: a numpy SeedSequence for this batch
+	Returns: coefficients (B, p), mse (B,) and r squared (B,) arrays
+	"""
+
+	rng = np.random.default_rng(seed)
+	index = np.triu_indices(p)
+
+	# every row of the count matrix is one resample drawn with replacement;
+	# binning uniform row indices gives the same multinomial counts as
+	# rng.multinomial with equal probabilities, at a fraction of the cost
+	counts = np.empty((n_resamples, n), dtype=np.int32)
+	for b in range(n_resamples):
+		counts[b] = np.bincount(rng.integers(0, n, size=n), minlength=n)
+
+	# cast to float for the matrix product a block of rows at a time, so
+	# the float copy stays small next to the int32 count matrix
+	sums = np.zeros((n_resamples, Z.shape[1]))
+	for start in range(0, n, _BLOCK_ROWS):
+		block = slice(start, start + _BLOCK_ROWS)
+		sums += counts[:, block].astype(float) @ Z[block]
+
+	n_gram = len(index[0])
+	gram = np.empty((n_resamples, p, p))
+	gram[:, index[0], index[1]] = sums[:, :n_gram]
+	gram[:, index[1], index[0]] = sums[:, :n_gram]
+	xy = sums[:, n_gram:n_gram + p]
+	yy = sums[:, -1]
+
+	try:
+		coefficients = np.linalg.solve(gram, xy[:, :, None])[:, :, 0]
+	except np.linalg.LinAlgError:
+		coefficients = (np.linalg.pinv(gram) @ xy[:, :, None])[:, :, 0]
+
+	# sum w (y - Xb)^2 expanded in terms of the sufficient statistics
+	sse = yy - 2 * np.einsum("bi,bi->b", coefficients, xy)\
+		+ np.einsum("bi,bij,bj->b", coefficients, gram, coefficients)
+	sst = yy - xy[:, 0] ** 2 / n
+
+	return coefficients, sse / n, 1 - sse / sst
+
+
+def _jackknife(A, y):
+	"""
+	Computes the leave-one-out coefficients, MSE and R squared in closed
+	form from the full fit, without refitting the model n times.
+	Parameters:
+		A: the (n, p) design matrix
+		y: an array of y values
+	Returns: coefficients (n, p), mse (n,) and r squared (n,) arrays
+	"""
+
+	n = len(y)
+	gram_inverse = np.linalg.pinv(A.T @ A)
+	coefficients = gram_inverse @ (A.T @ y)
+	residuals = y - A @ coefficients
+	leverage = np.einsum("ij,jk,ik->i", A, gram_inverse, A)
+	scale = residuals / (1 - leverage)
+
+	jack_coefficients = coefficients - (A @ gram_inverse) * scale[:, None]
+	jack_sse = residuals @ residuals - residuals * scale
+	jack_y_sum = y.sum() - y
+	jack_sst = (y @ y - y ** 2) - jack_y_sum ** 2 / (n - 1)
+
+	return jack_coefficients, jack_sse / (n - 1), 1 - jack_sse / jack_sst
+
+
+def _interval(estimate, replicates, jackknife, method, confidence):
+	"""
+	Turns bootstrap replicates of a statistic into a confidence interval.
+	Parameters:
+		estimate: the statistic computed on the full data, shape (m,)
+		replicates: the bootstrap replicates, shape (B, m)
+		jackknife: the leave-one-out values, shape (n, m); only used by 'bca'
+		method: 'percentile' or 'bca'
+		confidence: the confidence level of the interval
+	Returns: lower and upper bounds as arrays of shape (m,)
+	"""
+
+	alpha = (1 - confidence) / 2
+	if method == "percentile":
+		lower = np.quantile(replicates, alpha, axis=0)
+		upper = np.quantile(replicates, 1 - alpha, axis=0)
+		return lower, upper
+
+	normal = NormalDist()
+	lower = np.empty(len(estimate))
+	upper = np.empty(len(estimate))
+	for j in range(len(estimate)):
+		# bias correction from the share of replicates below the estimate
+		share = np.mean(replicates[:, j] < estimate[j])
+		share = min(max(share, 1 / (len(replicates) + 1)), 1 - 1 / (len(replicates) + 1))
+		z0 = normal.inv_cdf(share)
+
+		# acceleration from the skewness of the jackknife values
+		d = jackknife[:, j].mean() - jackknife[:, j]
+		denominator = 6 * (d @ d) ** 1.5
+		a = (d ** 3).sum() / denominator if denominator > 0 else 0.0
+
+		bounds = []
+		for level in (alpha, 1 - alpha):
+			z = z0 + normal.inv_cdf(level)
+			bounds.append(normal.cdf(z0 + z / (1 - a * z)))
+		lower[j] = np.quantile(replicates[:, j], bounds[0])
+		upper[j] = np.quantile(replicates[:, j], bounds[1])
+
+	return lower, upper
+
+
+def bootstrap(X, y, n_resamples=1000, statistic="all", method="percentile",
+			  confidence=0.95, batch_size=16, n_jobs=None, seed=None):
+	"""
+	Derives bootstrap confidence intervals for the OLS coefficients, the
+	mean squared error and R squared. Resample weights are drawn as a
+	multinomial count matrix and every resample's weighted Gram matrix is
+	computed with one matrix product per batch, so no model is refit in
+	a Python loop. Batches run concurrently on a thread pool; each
+	worker holds a batch_size x n int32 count matrix (64 MB for the
+	default batch_size at 1M rows), so memory grows with n_jobs.
+	Parameters:
+		X: an iterable of x values, or a 2D array of shape (n, p)
+		y: an iterable of y values
+		n_resamples: the number of bootstrap resamples
+		statistic: 'coef', 'mse', 'r_squared', or 'all'
+		method: 'percentile' or 'bca' (bias-corrected and accelerated)
+		confidence: the confidence level of the intervals
+		batch_size: the number of resamples drawn per batch
+		n_jobs: the number of worker threads; defaults to the CPU count,
+			capped at 4 since drawing the counts holds the GIL
+		seed: a seed for the random number generator
+	Returns: a dict mapping each statistic name to a dict with the
+		'estimate', 'lower' and 'upper' values; coefficients are
+		ordered intercept first
+	"""
+
+	statistics = ("coef", "mse", "r_squared")
+	if statistic == "all":
+		requested = statistics
+	elif statistic in statistics:
+		requested = (statistic,)
+	else:
+		raise ValueError("statistic must be 'coef', 'mse', 'r_squared' or 'all'")
+	if method not in ("percentile", "bca"):
+		raise ValueError("method must be 'percentile' or 'bca'")
+	if not 0 < confidence < 1:
+		raise ValueError("confidence must be between 0 and 1")
+	if n_resamples < 1 or batch_size < 1:
+		raise ValueError("n_resamples and batch_size must be positive")
+
+	A = _design_matrix(X)
+	y = np.asarray(y, dtype=float)
+	if len(A) != len(y):
+		raise ValueError("X and y must be same length")
+	if len(y) < 3:
+		raise ValueError("at least three observations are required")
+	n, p = A.shape
+
+	# center the features and y on their full-data means so the sufficient
+	# statistics below do not lose precision to large offsets; slopes,
+	# residuals, SSE and SST are unchanged and the intercept is recovered
+	# from the means afterwards
+	x_mean = A[:, 1:].mean(axis=0)
+	y_mean = y.mean()
+	A[:, 1:] -= x_mean
+	y = y - y_mean
+
+	def uncenter(coefficients):
+		coefficients = coefficients.copy()
+		coefficients[..., 0] += y_mean - coefficients[..., 1:] @ x_mean
+		return coefficients
+
+	# row-wise cross products, so that counts @ Z yields every resample's
+	# Gram matrix, X'y and y'y at once
+	index = np.triu_indices(p)
+	Z = np.column_stack([A[:, index[0]] * A[:, index[1]], A * y[:, None], y ** 2])
+
+	sizes = [batch_size] * (n_resamples // batch_size)
+	if n_resamples % batch_size:
+		sizes.append(n_resamples % batch_size)
+	seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+	workers = n_jobs or min(os.cpu_count() or 1, _MAX_WORKERS)
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		batches = list(pool.map(lambda args: _bootstrap_batch(Z, p, n, *args),
+								zip(sizes, seeds)))
+
+	replicates = {
+		name: np.concatenate([batch[i] for batch in batches])
+		for i, name in enumerate(statistics)
+	}
+	replicates["coef"] = uncenter(replicates["coef"])
+
+	coefficients = np.linalg.lstsq(A, y, rcond=None)[0]
+	mse = np.mean((y - A @ coefficients) ** 2)
+	estimates = {
+		"coef": uncenter(coefficients),
+		"mse": mse,
+		"r_squared": 1 - mse / np.var(y),
+	}
+	jackknife = {}
+	if method == "bca":
+		jackknife = dict(zip(statistics, _jackknife(A, y)))
+		jackknife["coef"] = uncenter(jackknife["coef"])
+
+	intervals = {}
+	for name in requested:
+		estimate = np.atleast_1d(estimates[name])
+		samples = replicates[name].reshape(n_resamples, -1)
+		jack = jackknife[name].reshape(n, -1) if jackknife else None
+		lower, upper = _interval(estimate, samples, jack, method, confidence)
+		if name != "coef":
+			estimate, lower, upper = estimate[0], lower[0], upper[0]
+		intervals[name] = {"estimate": estimate, "lower": lower, "upper": upper}
+
+	return intervals
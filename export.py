@@ -0,0 +1,222 @@
+import os
+import stat
+import struct
+import tempfile
+
+import numpy as np
+
+# File layout (little endian):
+#   header   magic, format version, dtype code, flags, feature count,
+#            length of the feature name blob, intercept
+#   names    feature names, UTF-8 encoded and newline separated
+#   padding  up to the next 16 byte boundary
+#   params   a (5, n_features) array in the stored dtype holding the
+#            coefficients, centers, scales, lower and upper clip bounds
+MAGIC = b"LRMX"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHcxIIId")
+_DTYPES = {b"f": np.dtype("<f4"), b"d": np.dtype("<f8")}
+_STANDARDIZE = 1
+_CLIP = 2
+
+# read once at import: os.umask can only be read by setting it, which
+# would briefly change it for every thread of a running server
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def _align(offset, alignment=16):
+	return -(-offset // alignment) * alignment
+
+
+def _coefficients(model, feature_names):
+	"""
+	Extracts the intercept, coefficients and feature names from a model.
+	Parameters:
+		model: the (slope, y_intercept) tuple returned by model.fit, or a
+			fitted statsmodels results object or params Series with a
+			'const' entry
+		feature_names: an optional list of feature names
+	Returns: the intercept, an array of coefficients and a list of names
+	"""
+
+	if isinstance(model, tuple):
+		if len(model) != 2:
+			raise ValueError("model must be a (slope, y_intercept) tuple")
+		slope, y_intercept = model
+		return float(y_intercept), np.array([slope], dtype=float), feature_names or ["x"]
+
+	params = getattr(model, "params", model)
+	if not hasattr(params, "index") or "const" not in params.index:
+		raise TypeError("model must be a (slope, y_intercept) tuple or have "
+						"params with a 'const' entry")
+	names = [name for name in params.index if name != "const"]
+	if feature_names is not None and list(feature_names) != names:
+		raise ValueError("feature_names do not match the model's features")
+	coefficients = np.array([params[name] for name in names], dtype=float)
+
+	return float(params["const"]), coefficients, [str(name) for name in names]
+
+
+def export_model(model, path, feature_names=None, center=None, scale=None,
+				 lower=None, upper=None, dtype="float64"):
+	"""
+	Writes a linear model and its preprocessing parameters to one small,
+	versioned binary file that load_model can memory-map for scoring.
+	At scoring time each feature is clipped to [lower, upper], then
+	standardized as (x - center) / scale, then scored.
+	Parameters:
+		model: the (slope, y_intercept) tuple returned by model.fit, or a
+			fitted statsmodels results object or params Series with a
+			'const' entry
+		path: the file to write
+		feature_names: the feature order; defaults to ['x'] for a tuple
+			model and to the statsmodels parameter names otherwise
+		center: optional per-feature values subtracted before scoring
+		scale: optional per-feature values divided by before scoring
+		lower: optional per-feature lower clip bounds
+		upper: optional per-feature upper clip bounds
+		dtype: 'float32' or 'float64', the dtype stored and scored in
+	Returns: the path written
+	"""
+
+	codes = {np.dtype("float32"): b"f", np.dtype("float64"): b"d"}
+	if np.dtype(dtype) not in codes:
+		raise ValueError("dtype must be 'float32' or 'float64'")
+	code = codes[np.dtype(dtype)]
+
+	intercept, coefficients, feature_names = _coefficients(model, feature_names)
+	n_features = len(coefficients)
+	if n_features == 0:
+		raise ValueError("model must have at least one feature")
+	if len(feature_names) != n_features:
+		raise ValueError("feature_names must have one name per coefficient")
+	if any("\n" in name for name in feature_names):
+		raise ValueError("feature names cannot contain newlines")
+
+	def per_feature(values, default):
+		if values is None:
+			return np.full(n_features, default)
+		return np.broadcast_to(np.asarray(values, dtype=float), (n_features,))
+
+	flags = 0
+	if center is not None or scale is not None:
+		flags |= _STANDARDIZE
+	if lower is not None or upper is not None:
+		flags |= _CLIP
+	params = np.stack([
+		coefficients,
+		per_feature(center, 0.0),
+		per_feature(scale, 1.0),
+		per_feature(lower, -np.inf),
+		per_feature(upper, np.inf),
+	]).astype(_DTYPES[code])
+	if np.any(params[2] == 0):
+		raise ValueError("scale must be non-zero")
+
+	names = "\n".join(feature_names).encode("utf-8")
+	header = _HEADER.pack(MAGIC, FORMAT_VERSION, code, flags, n_features,
+						  len(names), intercept)
+	padding = _align(len(header) + len(names)) - len(header) - len(names)
+
+	# write to a temporary file and move it into place, so a scorer that
+	# has the old file memory-mapped keeps reading the old model
+	descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+											 prefix=".tmp-", suffix=".lrm")
+	try:
+		with os.fdopen(descriptor, "wb") as f:
+			f.write(header)
+			f.write(names)
+			f.write(b"\0" * padding)
+			f.write(params.tobytes())
+		# mkstemp creates the file owner-only; keep the mode of the file
+		# being replaced, or give a new file the mode open() would
+		try:
+			mode = stat.S_IMODE(os.stat(path).st_mode)
+		except FileNotFoundError:
+			mode = 0o666 & ~_UMASK
+		os.chmod(temporary, mode)
+		os.replace(temporary, path)
+	except BaseException:
+		os.unlink(temporary)
+		raise
+
+	return path
+
+
+class LinearScorer:
+	"""
+	Scores batches with a model written by export_model. Only NumPy is
+	needed; the parameters are memory-mapped rather than read and parsed.
+	"""
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			header = f.read(_HEADER.size)
+			if len(header) < _HEADER.size:
+				raise ValueError("not a model file: truncated header")
+			magic, version, code, flags, n_features, names_length, intercept\
+				= _HEADER.unpack(header)
+			if magic != MAGIC:
+				raise ValueError("not a model file: bad magic number")
+			if version != FORMAT_VERSION:
+				raise ValueError(f"unsupported model format version {version}")
+			if code not in _DTYPES:
+				raise ValueError("not a model file: unknown dtype")
+			names = f.read(names_length).decode("utf-8")
+
+		self.path = path
+		self.version = version
+		self.dtype = _DTYPES[code]
+		self.flags = flags
+		self.feature_names = names.split("\n")
+		self.intercept = self.dtype.type(intercept)
+		params = np.memmap(path, dtype=self.dtype, mode="r", shape=(5, n_features),
+						   offset=_align(_HEADER.size + names_length))
+		self.coefficients, self.center, self.scale, self.lower, self.upper = params
+
+	def _matrix(self, X):
+		"""
+		Arranges the input as an (n, n_features) array in feature order.
+		Parameters:
+			X: a 2D array already in feature order, a 1D array (one column
+				for a single-feature model, otherwise one row), or a
+				DataFrame or dict keyed by feature name
+		Returns: a 2D array in the scorer's dtype
+		"""
+
+		if hasattr(X, "columns") or isinstance(X, dict):
+			X = np.column_stack([np.asarray(X[name]) for name in self.feature_names])
+		X = np.asarray(X, dtype=self.dtype)
+		if X.ndim == 1:
+			X = X[:, None] if len(self.feature_names) == 1 else X[None, :]
+		if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+			raise ValueError(f"X must have {len(self.feature_names)} feature columns")
+		return X
+
+	def predict(self, X):
+		"""
+		Predicts y-values for a batch of rows.
+		Parameters:
+			X: a 2D array in feature order, a 1D array, or a DataFrame or
+				dict keyed by feature name
+		Returns: an array of predicted y-values
+		"""
+
+		X = self._matrix(X)
+		if self.flags & _CLIP:
+			X = np.clip(X, self.lower, self.upper)
+		if self.flags & _STANDARDIZE:
+			X = (X - self.center) / self.scale
+		return X @ self.coefficients + self.intercept
+
+
+def load_model(path):
+	"""
+	Memory-maps a model written by export_model for scoring.
+	Parameters:
+		path: the model file
+	Returns: a LinearScorer
+	"""
+
+	return LinearScorer(path)
@@ -1,4 +1,8 @@
+import numpy as np
+import pandas as pd
+
 from eda import *
+from validation import check_array, check_scalar
 
 def fit(x, y):
 	"""
@@ -9,28 +13,28 @@ def fit(x, y):
 	Returns: slope and y intercept as floats
 	"""
 
-	if not isinstance(x, (list, tuple)) and isinstance(y, (list, tuple)):
-		raise TypeError("x and y must be iterables")
+	x = check_array(x, "x")
+	y = check_array(y, "y")
 	if len(x) != len(y):
 		raise ValueError("x and y must be same length")
 
 	x_mean = calculate_mean(x)
 	y_mean = calculate_mean(y)
 
-	x_difference = [value - x_mean for value in x]
-	y_difference = [value - y_mean for value in y]
-
-	squares = [difference ** 2 for difference in x_difference]
+	# compare the values themselves: centering a constant x can leave
+	# rounding noise rather than an exact zero sum of squares
+	if x.min() == x.max():
+		raise ValueError("x must not be constant")
 
-	product = [x_diff * y_diff for x_diff, y_diff in\
-			zip(x_difference, y_difference)]
+	x_difference = x - x_mean
+	y_difference = y - y_mean
 
-	slope = sum(product) / sum(squares)
+	slope = (x_difference @ y_difference) / (x_difference @ x_difference)
 
 	y_intercept = y_mean - (slope * x_mean)
 
 	# print(f"{slope}, {y_intercept}")
-	return (slope, y_intercept)
+	return (float(slope), float(y_intercept))
 
 
 def predict(x, slope, y_intercept):
@@ -43,18 +47,138 @@ def predict(x, slope, y_intercept):
 	Returns: an iterable of predicted y-values
 	"""
 
-	if not isinstance(x, (list, tuple)):
-		raise TypeError("x must be an iterable")
-	if not all(isinstance(i, (int, float)) for i in x):
-		raise TypeError("all elements of x must be numeric")
-	if not isinstance(slope, (int, float)):
-		raise TypeError("slope must be a numeric value")
-	if not isinstance(y_intercept, (int, float)):
-		raise TypeError("y intercept must be a numeric value")
+	x = check_array(x, "x")
+	check_scalar(slope, "slope")
+	check_scalar(y_intercept, "y intercept")
 
-	predicted_y = [((slope * i) + y_intercept) for i in x]
+	predicted_y = ((slope * x) + y_intercept).tolist()
 
-	print(predicted_y)
 	return predicted_y
 
 
+def fit_grouped(df, group_col, x_cols, y_col, weights=None):
+	"""
+	Fits one (weighted) OLS model per group in a single call. Rows are
+	sorted by group once, the per-group sufficient statistics are formed
+	with segmented reductions, and every group's normal equations are
+	solved in one batched solve.
+	Parameters:
+		df: a DataFrame holding the group, feature and target columns
+		group_col: the name of the column identifying each group
+		x_cols: a list of feature column names
+		y_col: the name of the target column
+		weights: an optional column name or iterable of non-negative
+			sample weights
+	Returns: a DataFrame indexed by group with an 'intercept' column,
+		one coefficient column per feature and 'n_obs', the number of
+		rows with positive weight; groups whose features are rank
+		deficient (too few such rows, a constant feature, or collinear
+		features) get NaN coefficients
+	"""
+
+	if isinstance(x_cols, str):
+		x_cols = [x_cols]
+	if len(df) == 0:
+		raise ValueError("Empty dataset")
+
+	if weights is None:
+		w = np.ones(len(df))
+	elif isinstance(weights, str):
+		w = check_array(df[weights].to_numpy(dtype=float), "weights")
+	else:
+		w = check_array(np.asarray(weights, dtype=float), "weights")
+	if len(w) != len(df):
+		raise ValueError("weights must be same length as df")
+	if np.any(w < 0):
+		raise ValueError("weights must be non-negative")
+
+	codes, groups = pd.factorize(df[group_col], sort=True)
+	if np.any(codes < 0):
+		raise ValueError("group column must not contain missing values")
+	order = np.argsort(codes, kind="stable")
+	sorted_codes = codes[order]
+	starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+
+	X = check_array(df[x_cols].to_numpy(dtype=float), "x_cols", ndim=2)[order]
+	y = check_array(df[y_col].to_numpy(dtype=float), "y_col")[order]
+	w = w[order]
+	sizes = np.diff(np.r_[starts, len(X)])
+	n_obs = np.add.reduceat(w > 0, starts)
+	p = X.shape[1]
+
+	# center every segment on its weighted means before forming cross
+	# products, so large offsets do not cost precision; the intercept is
+	# recovered from the means after the slopes are solved
+	group_weight = np.add.reduceat(w, starts)
+	group_weight[group_weight == 0] = np.nan
+	x_mean = np.add.reduceat(X * w[:, None], starts, axis=0) / group_weight[:, None]
+	y_mean = np.add.reduceat(y * w, starts) / group_weight
+	X = X - np.repeat(x_mean, sizes, axis=0)
+	y = y - np.repeat(y_mean, sizes)
+
+	# weighted row-wise cross products, summed within each group segment
+	index = np.triu_indices(p)
+	Z = np.column_stack([X[:, index[0]] * X[:, index[1]], X * y[:, None]]) * w[:, None]
+	sums = np.add.reduceat(Z, starts, axis=0)
+
+	n_gram = len(index[0])
+	gram = np.empty((len(starts), p, p))
+	gram[:, index[0], index[1]] = sums[:, :n_gram]
+	gram[:, index[1], index[0]] = sums[:, :n_gram]
+	xy = sums[:, n_gram:]
+
+	# a group is rank deficient when it has no more weighted rows than
+	# features, a feature that is constant within it, or collinear
+	# features; a centered variance at rounding level of the feature's
+	# magnitude counts as constant
+	diagonal = gram[:, np.arange(p), np.arange(p)]
+	magnitude = diagonal + group_weight[:, None] * x_mean ** 2
+	tolerance = (sizes[:, None] * np.finfo(float).eps) ** 2 * magnitude
+	full_rank = (n_obs > p)\
+		& np.all(diagonal > tolerance, axis=1)
+	scale = np.sqrt(diagonal[full_rank])
+	correlation = gram[full_rank] / scale[:, :, None] / scale[:, None, :]
+	full_rank[full_rank] = np.linalg.matrix_rank(correlation, tol=1e-10) == p
+
+	slopes = np.full((len(starts), p), np.nan)
+	slopes[full_rank] = np.linalg.solve(gram[full_rank], xy[full_rank, :, None])[:, :, 0]
+	intercepts = y_mean - np.einsum("gi,gi->g", x_mean, slopes)
+	coefficients = np.column_stack([intercepts, slopes])
+
+	table = pd.DataFrame(coefficients, index=pd.Index(groups, name=group_col),
+						 columns=["intercept"] + list(x_cols))
+	table["n_obs"] = n_obs
+
+	return table
+
+
+def predict_grouped(df, coefficients, group_col, x_cols=None):
+	"""
+	Predicts y-values with the per-group models from fit_grouped by
+	looking up each row's group in the coefficient table.
+	Parameters:
+		df: a DataFrame holding the group and feature columns
+		coefficients: the coefficient table returned by fit_grouped
+		group_col: the name of the column identifying each group
+		x_cols: a list of feature column names; defaults to the
+			feature columns of the coefficient table
+	Returns: a Series of predicted y-values aligned with df; rows whose
+		group was not seen during fitting are NaN
+	"""
+
+	if x_cols is None:
+		x_cols = [col for col in coefficients.columns if col not in ("intercept", "n_obs")]
+	elif isinstance(x_cols, str):
+		x_cols = [x_cols]
+
+	rows = coefficients.index.get_indexer(df[group_col])
+	known = rows >= 0
+
+	X = df[x_cols].to_numpy(dtype=float)[known]
+	slopes = coefficients[x_cols].to_numpy(dtype=float)[rows[known]]
+	intercepts = coefficients["intercept"].to_numpy(dtype=float)[rows[known]]
+
+	predicted_y = np.full(len(df), np.nan)
+	predicted_y[known] = intercepts + np.einsum("ij,ij->i", X, slopes)
+
+	return pd.Series(predicted_y, index=df.index, name="predicted")
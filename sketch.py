@@ -0,0 +1,168 @@
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    A mergeable KLL quantile sketch for approximate quantiles of large or
+    streamed numeric data in bounded memory.
+
+    Values are added in chunks with `update`, sketches built on different
+    workers are combined with `merge`, and `quantile` answers any quantile
+    query from the retained sample. With the default k=200 the rank error
+    of a quantile is roughly 1% (it shrinks in proportion to 1/k), while
+    the sketch keeps only about 3*k values regardless of how many it has
+    seen. Sketches can be pickled and reused at serving time.
+
+    Parameters:
+    -----------
+    k : int, default=200
+        Accuracy parameter; the capacity of the top compactor.
+    seed : int, optional
+        Seed for the random offsets used when compacting.
+    """
+
+    def __init__(self, k=200, seed=None):
+        if k < 8:
+            raise ValueError("k must be at least 8")
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+        self._levels = [np.empty(0)]
+
+    @classmethod
+    def from_chunks(cls, chunks, k=200, seed=None):
+        """
+        Build a sketch from an iterable of chunks, e.g. the columns of
+        `pd.read_csv(..., chunksize=...)`.
+
+        Parameters:
+        -----------
+        chunks : iterable
+            Iterable of array-like chunks of numeric values.
+        k : int, default=200
+            Accuracy parameter passed to the sketch.
+        seed : int, optional
+            Seed for the random offsets used when compacting.
+
+        Returns:
+        --------
+        QuantileSketch
+            The sketch of all chunks.
+        """
+        sketch = cls(k=k, seed=seed)
+        for chunk in chunks:
+            sketch.update(chunk)
+        return sketch
+
+    def update(self, values):
+        """
+        Add a chunk of values to the sketch. NaN values are ignored.
+
+        Parameters:
+        -----------
+        values : array-like
+            Numeric values to add.
+
+        Returns:
+        --------
+        QuantileSketch
+            The updated sketch (self).
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one, as if it had seen both streams.
+
+        Parameters:
+        -----------
+        other : QuantileSketch
+            A sketch built with the same k.
+
+        Returns:
+        --------
+        QuantileSketch
+            The merged sketch (self).
+        """
+        if not isinstance(other, QuantileSketch):
+            raise TypeError("other must be a QuantileSketch")
+        if other.k != self.k:
+            raise ValueError("sketches must share the same k to be merged")
+
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate one or more quantiles of the values seen so far.
+
+        Parameters:
+        -----------
+        q : float or array-like
+            Quantile(s) to compute, each between 0 and 1.
+
+        Returns:
+        --------
+        float or np.ndarray
+            The estimated quantile(s), matching the shape of q.
+        """
+        if self.count == 0:
+            raise ValueError("Empty sketch")
+        q = np.asarray(q, dtype=float)
+        if np.any((q < 0) | (q > 1)):
+            raise ValueError("quantiles must be between 0 and 1")
+
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(retained), 2.0 ** level)
+                                  for level, retained in enumerate(self._levels)])
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+
+        index = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        result = items[np.clip(index, 0, len(items) - 1)]
+        result = np.where(q == 0, self.min, np.where(q == 1, self.max, result))
+        return float(result) if result.ndim == 0 else result
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        # compact every level over capacity until all fit; each compaction
+        # sorts the level and promotes every other item at double weight
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self._levels)):
+                items = self._levels[level]
+                if len(items) <= self._capacity(level):
+                    continue
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                items = np.sort(items)
+                odd = len(items) % 2
+                promoted = items[odd + self._rng.integers(2)::2]
+                self._levels[level] = items[:odd]
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+                compacted = True
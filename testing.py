@@ -1,10 +1,17 @@
+import asyncio
+import os
+import tempfile
 import unittest
 import pandas as pd
 import numpy as np
-from cleaning import fill_missing_values, remove_outliers_iqr, encode_categorical, preprocess_data
+from cleaning import fill_missing_values, remove_outliers_iqr, encode_categorical, preprocess_data, iqr_bounds
 from eda import calculate_mean, calculate_median, calculate_variance, calculate_std
-from model import fit, predict
-from evaluation import calculate_mse, calculate_r_squared
+from model import fit, predict, fit_grouped, predict_grouped
+from evaluation import calculate_mse, calculate_r_squared, bootstrap
+from sketch import QuantileSketch
+from export import export_model, load_model
+from batching import PredictionBatcher
+from validation import check_array, check_scalar, validation_disabled, ValidatedArray
 
 class TestFunctions(unittest.TestCase):
   
@@ -118,6 +125,11 @@ class TestFunctions(unittest.TestCase):
 		with self.assertRaises(TypeError):
 			fit(x, y)
 
+		# test with a constant x
+		for x in ([2, 2, 2], [0.1, 0.1, 0.1]):
+			with self.assertRaises(ValueError):
+				fit(x, [1, 2, 3])
+
 	def test_predict_typical(self):
 
 		# test with typical data
@@ -190,6 +202,392 @@ class TestFunctions(unittest.TestCase):
 		with self.assertRaises(TypeError):
 			calculate_r_squared(y, predicted_y)
 
+class TestGroupedRegression(unittest.TestCase):
+
+	def setUp(self):
+		self.df = pd.DataFrame({
+			"store": ["b", "a", "b", "a", "b", "a", "c", "c", "c"],
+			"x": [1, 1, 2, 2, 3, 3, 1, 2, 4],
+			"y": [3, 0, 5, -1, 7, -2, 10, 10, 10],
+		})
+
+	def test_fit_grouped_typical(self):
+
+		# test that each group gets its own exact line
+		table = fit_grouped(self.df, "store", ["x"], "y")
+		self.assertEqual(list(table.index), ["a", "b", "c"])
+		np.testing.assert_allclose(table["intercept"], [1.0, 1.0, 10.0], atol=1e-9)
+		np.testing.assert_allclose(table["x"], [-1.0, 2.0, 0.0], atol=1e-9)
+		self.assertEqual(list(table["n_obs"]), [3, 3, 3])
+
+	def test_fit_grouped_weights(self):
+
+		# test that weights match a weighted least squares fit
+		df = pd.DataFrame({
+			"store": ["a"] * 4,
+			"x": [0.0, 1.0, 2.0, 3.0],
+			"y": [1.0, 2.0, 2.0, 5.0],
+			"w": [1.0, 2.0, 0.5, 3.0],
+		})
+		table = fit_grouped(df, "store", ["x"], "y", weights="w")
+		A = np.column_stack([np.ones(4), df["x"]]) * np.sqrt(df["w"].to_numpy())[:, None]
+		expected = np.linalg.lstsq(A, df["y"] * np.sqrt(df["w"]), rcond=None)[0]
+		np.testing.assert_allclose(table.loc["a", ["intercept", "x"]], expected)
+
+		# test with negative weights
+		with self.assertRaises(ValueError):
+			fit_grouped(df, "store", ["x"], "y", weights=[1, -1, 1, 1])
+
+		# test that n_obs counts only positively weighted rows
+		df["store"] = ["a", "a", "z", "z"]
+		table = fit_grouped(df, "store", ["x"], "y", weights=[1, 1, 0, 0])
+		self.assertEqual(list(table["n_obs"]), [2, 0])
+		self.assertTrue(table.loc["z", ["intercept", "x"]].isna().all())
+
+	def test_fit_grouped_bad_input(self):
+
+		# test with NaN or infinite values in the features, target or weights
+		bad_x = self.df.assign(x=[1, np.nan, 2, 2, 3, 3, 1, 2, 4])
+		bad_y = self.df.assign(y=[3, 0, 5, -1, np.inf, -2, 10, 10, 10])
+		with self.assertRaises(ValueError):
+			fit_grouped(bad_x, "store", ["x"], "y")
+		with self.assertRaises(ValueError):
+			fit_grouped(bad_y, "store", ["x"], "y")
+		with self.assertRaises(ValueError):
+			fit_grouped(self.df, "store", ["x"], "y", weights=[1] * 8 + [np.nan])
+
+	def test_fit_grouped_rank_deficient(self):
+
+		# test that a constant-x group and a one-row group get NaN
+		# coefficients without affecting the other groups
+		df = pd.DataFrame({
+			"store": ["a", "a", "a", "k", "k", "k", "o"],
+			"x": [1, 2, 3, 0.3, 0.3, 0.3, 5],
+			"y": [3, 5, 7, 5, 6, 7, 4],
+		})
+		table = fit_grouped(df, "store", ["x"], "y")
+		np.testing.assert_allclose(table.loc["a", ["intercept", "x"]], [1.0, 2.0])
+		self.assertTrue(table.loc[["k", "o"], ["intercept", "x"]].isna().all().all())
+		self.assertTrue(predict_grouped(df, table, "store")[3:].isna().all())
+
+	def test_fit_grouped_large_offset(self):
+
+		# test that features far from zero match np.polyfit
+		rng = np.random.default_rng(0)
+		x = rng.normal(size=100) + 1e6
+		df = pd.DataFrame({"store": "a", "x": x, "y": 2 * x + rng.normal(size=100)})
+		table = fit_grouped(df, "store", ["x"], "y")
+		np.testing.assert_allclose(table.loc["a", ["x", "intercept"]],
+								   np.polyfit(df["x"], df["y"], 1), rtol=1e-8)
+
+	def test_predict_grouped(self):
+
+		# test that predictions use each row's group and unseen groups are NaN
+		table = fit_grouped(self.df, "store", ["x"], "y")
+		new = pd.DataFrame({"store": ["a", "c", "b", "z"], "x": [5, 5, 5, 5]})
+		predicted = predict_grouped(new, table, "store")
+		np.testing.assert_allclose(predicted[:3], [-4.0, 10.0, 11.0], atol=1e-9)
+		self.assertTrue(np.isnan(predicted.iloc[3]))
+
+class TestModelExport(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "model.lrm")
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	def test_export_fit_tuple(self):
+
+		# test that a round trip reproduces model.predict
+		x = [1, 2, 3, 4, 5]
+		y = [3, 5, 7, 9, 11]
+		slope, y_intercept = fit(x, y)
+		scorer = load_model(export_model((slope, y_intercept), self.path))
+		self.assertEqual(scorer.feature_names, ["x"])
+		np.testing.assert_allclose(scorer.predict(x), [3, 5, 7, 9, 11])
+
+	def test_export_preprocessing(self):
+
+		# test multivariate params with clipping, scaling and float32 storage
+		params = pd.Series({"const": 1.0, "a": 2.0, "b": -1.0})
+		export_model(params, self.path, center=[1, 2], scale=[2, 4],
+					 lower=-5, upper=5, dtype="float32")
+		scorer = load_model(self.path)
+		self.assertEqual(scorer.dtype, np.float32)
+		X = pd.DataFrame({"b": [2, 100], "a": [3, -100]})
+		np.testing.assert_allclose(scorer.predict(X), [3.0, -5.75])
+		np.testing.assert_allclose(scorer.predict([[3, 2]]), [3.0])
+
+	def test_export_while_loaded(self):
+
+		# test that re-exporting to a loaded path leaves the old scorer intact
+		old = pd.Series({"const": 1.0, **{f"x{i}": float(i) for i in range(50)}})
+		scorer = load_model(export_model(old, self.path))
+		export_model((2.0, 1.0), self.path)
+		np.testing.assert_allclose(scorer.predict(np.ones((1, 50))), [1226.0])
+		np.testing.assert_allclose(load_model(self.path).predict([1.0]), [3.0])
+		self.assertEqual(os.listdir(self.directory.name), ["model.lrm"])
+
+	def test_export_file_mode(self):
+
+		# test that a replaced file keeps its mode and a new one is not owner-only
+		export_model((2.0, 1.0), self.path)
+		self.assertTrue(os.stat(self.path).st_mode & 0o044)
+		os.chmod(self.path, 0o640)
+		export_model((3.0, 1.0), self.path)
+		self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+	def test_export_bad_input(self):
+
+		# test with an unsupported dtype
+		with self.assertRaises(ValueError):
+			export_model((2.0, 1.0), self.path, dtype="int32")
+
+		# test with a file that is not a model
+		with open(self.path, "wb") as f:
+			f.write(b"not a model file at all, just some bytes")
+		with self.assertRaises(ValueError):
+			load_model(self.path)
+
+		# test with the wrong number of feature columns
+		scorer = load_model(export_model((2.0, 1.0), self.path))
+		with self.assertRaises(ValueError):
+			scorer.predict([[1, 2]])
+
+class TestPredictionBatcher(unittest.TestCase):
+
+	def test_batches_concurrent_requests(self):
+
+		# test that concurrent requests share batches and get their own rows back
+		calls = []
+		def predict_fn(X):
+			calls.append(len(X))
+			return 2 * X[:, 0] + 1
+
+		async def run():
+			async with PredictionBatcher(predict_fn, max_batch_size=8, max_delay_ms=50) as batcher:
+				results = await asyncio.gather(*[batcher.predict([i]) for i in range(20)])
+				many = await batcher.predict([[1], [2], [3]])
+				return results, many, batcher.metrics()
+
+		results, many, metrics = asyncio.run(run())
+		self.assertEqual([float(r[0]) for r in results], [2 * i + 1 for i in range(20)])
+		self.assertEqual(list(many), [3.0, 5.0, 7.0])
+		self.assertTrue(all(size <= 8 for size in calls))
+		self.assertLess(len(calls), 20)
+		self.assertEqual(metrics["requests"], 21)
+		self.assertEqual(metrics["rows"], 23)
+		self.assertEqual(metrics["batches"], len(calls))
+		self.assertEqual(metrics["queue_depth"], 0)
+
+	def test_batches_respect_row_cap(self):
+
+		# test that multi-row requests never push a batch past max_batch_size
+		calls = []
+		def predict_fn(X):
+			calls.append(len(X))
+			return X[:, 0]
+
+		async def run():
+			async with PredictionBatcher(predict_fn, max_batch_size=8, max_delay_ms=50) as batcher:
+				results = await asyncio.gather(*[batcher.predict(np.full((5, 1), i))
+												 for i in range(6)])
+				large = await batcher.predict(np.zeros((12, 1)))
+				return results, large, batcher.metrics()
+
+		results, large, metrics = asyncio.run(run())
+		self.assertEqual([list(r) for r in results], [[float(i)] * 5 for i in range(6)])
+		self.assertEqual(len(large), 12)
+		self.assertEqual(calls, [5] * 6 + [12])
+		self.assertEqual(metrics["largest_batch_size"], 12)
+
+	def test_malformed_request_fails_alone(self):
+
+		# test that a request with the wrong column count does not fail the others
+		async def run():
+			async with PredictionBatcher(lambda X: X.sum(axis=1), max_delay_ms=50) as batcher:
+				return await asyncio.gather(batcher.predict([1, 2]), batcher.predict([3, 4]),
+											batcher.predict([1, 2, 3]), return_exceptions=True)
+
+		first, second, malformed = asyncio.run(run())
+		self.assertEqual(list(first), [3.0])
+		self.assertEqual(list(second), [7.0])
+		self.assertIsInstance(malformed, ValueError)
+
+	def test_predict_after_close(self):
+
+		# test that a request racing close() raises instead of hanging
+		async def run():
+			batcher = PredictionBatcher(lambda X: X[:, 0])
+			await batcher.predict([1])
+			closing = asyncio.ensure_future(batcher.close())
+			await asyncio.sleep(0)
+			with self.assertRaises(RuntimeError):
+				await asyncio.wait_for(batcher.predict([2]), 1)
+			await closing
+			with self.assertRaises(RuntimeError):
+				await batcher.predict([3])
+
+		asyncio.run(run())
+
+	def test_predict_error_reaches_callers(self):
+
+		# test that an exception in predict_fn reaches every caller in the batch
+		def predict_fn(X):
+			raise TypeError("bad batch")
+
+		async def run():
+			async with PredictionBatcher(predict_fn) as batcher:
+				return await asyncio.gather(batcher.predict([1]), batcher.predict([2]),
+											return_exceptions=True)
+
+		first, second = asyncio.run(run())
+		for result in (first, second):
+			self.assertIsInstance(result, RuntimeError)
+			self.assertIsInstance(result.__cause__, TypeError)
+		self.assertIsNot(first, second)
+
+		# test with an invalid batch size
+		with self.assertRaises(ValueError):
+			PredictionBatcher(predict_fn, max_batch_size=0)
+
+class TestBootstrap(unittest.TestCase):
+
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		self.x = rng.normal(size=200)
+		self.y = 3 + 2 * self.x + rng.normal(size=200)
+
+	def test_bootstrap_percentile(self):
+
+		# test that every interval brackets the full-data estimate
+		result = bootstrap(self.x, self.y, n_resamples=200, seed=1)
+		self.assertEqual(set(result), {"coef", "mse", "r_squared"})
+		self.assertEqual(result["coef"]["estimate"].shape, (2,))
+		for interval in result.values():
+			self.assertTrue(np.all(interval["lower"] <= interval["estimate"]))
+			self.assertTrue(np.all(interval["estimate"] <= interval["upper"]))
+
+		# test that the slope interval covers the true slope
+		self.assertLess(result["coef"]["lower"][1], 2)
+		self.assertGreater(result["coef"]["upper"][1], 2)
+
+	def test_bootstrap_bca(self):
+
+		# test with a single statistic and bias-corrected intervals
+		result = bootstrap(self.x, self.y, n_resamples=200, statistic="r_squared",
+						   method="bca", seed=1)
+		self.assertEqual(list(result), ["r_squared"])
+		self.assertLess(result["r_squared"]["lower"], result["r_squared"]["upper"])
+
+	def test_bootstrap_reproducible(self):
+
+		# test that a seed fixes the resamples regardless of thread count
+		first = bootstrap(self.x, self.y, n_resamples=50, statistic="mse",
+						  batch_size=7, n_jobs=1, seed=3)
+		second = bootstrap(self.x, self.y, n_resamples=50, statistic="mse",
+						   batch_size=7, n_jobs=4, seed=3)
+		self.assertEqual(first, second)
+
+	def test_bootstrap_large_offset(self):
+
+		# test that data far from zero keeps MSE and R squared in range
+		x = self.x + 1e7
+		y = self.y + 1e7
+		for method in ("percentile", "bca"):
+			result = bootstrap(x, y, n_resamples=200, method=method, seed=1)
+			self.assertGreaterEqual(result["mse"]["lower"], 0)
+			self.assertLessEqual(result["r_squared"]["upper"], 1)
+			np.testing.assert_allclose(result["coef"]["estimate"],
+									   np.polyfit(x, y, 1)[::-1], rtol=1e-6)
+
+	def test_bootstrap_bad_input(self):
+
+		# test with unknown statistic and method names
+		with self.assertRaises(ValueError):
+			bootstrap(self.x, self.y, statistic="mae")
+		with self.assertRaises(ValueError):
+			bootstrap(self.x, self.y, method="basic")
+
+		# test with mismatched lengths
+		with self.assertRaises(ValueError):
+			bootstrap(self.x, self.y[:-1])
+
+class TestValidation(unittest.TestCase):
+
+	def test_check_array_numpy_types(self):
+
+		# test that numpy integer and float dtypes are accepted
+		self.assertEqual(calculate_mean(np.array([1, 2, 3], dtype=np.int64)), 2)
+		self.assertEqual(calculate_median(np.array([1, 2, 3], dtype=np.float32)), 2)
+		self.assertEqual(predict(np.array([1.0, 2.0]), np.float32(2), np.int64(1)), [3.0, 5.0])
+		check_scalar(np.float64(1.5))
+
+	def test_check_array_bad_input(self):
+
+		# test with NaN and infinite values
+		with self.assertRaises(ValueError):
+			calculate_mean([1.0, np.nan])
+		with self.assertRaises(ValueError):
+			calculate_variance([1.0, np.inf])
+
+		# test with the wrong number of dimensions
+		with self.assertRaises(ValueError):
+			check_array([[1, 2], [3, 4]])
+
+		# test with mixed and object values
+		with self.assertRaises(TypeError):
+			check_array([1, "a"])
+		with self.assertRaises(TypeError):
+			check_array([1, None])
+
+	def test_check_array_cached(self):
+
+		# test that validated arrays and their slices skip re-validation
+		x = check_array([1.0, 2.0, 3.0])
+		self.assertIsInstance(x, ValidatedArray)
+		self.assertIs(check_array(x), x)
+		self.assertIsInstance(x[1:], ValidatedArray)
+
+		# test that the cheap checks still run on validated arrays
+		with self.assertRaises(ValueError):
+			calculate_mean(x[0:0])
+		with self.assertRaises(ValueError):
+			calculate_mean(check_array([[1, 2], [3, 4]], ndim=2))
+
+		# test that an array validated with allow_nan is scanned again
+		lenient = check_array([1.0, np.nan], allow_nan=True)
+		self.assertTrue(lenient.allow_nan)
+		with self.assertRaises(ValueError):
+			calculate_mean(lenient)
+		self.assertFalse(check_array(check_array([1.0, 2.0], allow_nan=True)).allow_nan)
+
+		# test that the default is a read-only view that leaves the caller's
+		# array writable, and that copy=True detaches from the caller's data
+		original = np.array([1.0, 2.0, 3.0])
+		view = check_array(original)
+		copied = check_array(original, copy=True)
+		self.assertTrue(np.shares_memory(view, original))
+		self.assertTrue(original.flags.writeable)
+		original[0] = np.nan
+		self.assertEqual(calculate_mean(copied), 2.0)
+		with self.assertRaises(ValueError):
+			view[1] = np.nan
+
+		# test that arithmetic results are no longer marked as validated
+		self.assertNotIsInstance(x * 2, ValidatedArray)
+
+	def test_validation_disabled(self):
+
+		# test that checks are skipped inside the block and restored after
+		with validation_disabled():
+			self.assertTrue(np.isnan(calculate_mean([1.0, np.nan])))
+			check_scalar("a")
+		with self.assertRaises(ValueError):
+			calculate_mean([1.0, np.nan])
+
 class TestDataCleaning(unittest.TestCase):
 
     def test_fill_missing_values(self):
@@ -292,5 +690,55 @@ class TestDataCleaning(unittest.TestCase):
         self.assertTrue(np.issubdtype(preprocessed_df['numeric_col'].dtype, np.number))
 
 
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_quantiles_within_error(self):
+        # Build a sketch from chunks and compare ranks against the exact data
+        rng = np.random.default_rng(0)
+        x = rng.lognormal(size=100000)
+        sketch = QuantileSketch.from_chunks(np.array_split(x, 10), seed=0)
+        qs = np.array([0.1, 0.25, 0.5, 0.75, 0.9])
+        ranks = np.searchsorted(np.sort(x), sketch.quantile(qs)) / len(x)
+        self.assertTrue(np.all(np.abs(ranks - qs) < 0.02))
+        # Memory stays bounded regardless of the stream length
+        self.assertLess(sum(len(level) for level in sketch._levels), 3 * sketch.k)
+
+    def test_merge(self):
+        # Sketches built on separate workers merge into one over all values
+        left = QuantileSketch(seed=1).update(np.arange(0, 5000))
+        right = QuantileSketch(seed=2).update(np.arange(5000, 10000))
+        merged = left.merge(right)
+        self.assertEqual(merged.count, 10000)
+        self.assertEqual(merged.quantile(0), 0)
+        self.assertEqual(merged.quantile(1), 9999)
+        self.assertLess(abs(merged.quantile(0.5) - 5000), 200)
+        with self.assertRaises(ValueError):
+            merged.merge(QuantileSketch(k=50))
+
+    def test_median_and_iqr_bounds(self):
+        # calculate_median and iqr_bounds accept a sketch in place of the data
+        sketch = QuantileSketch().update([9, 10, 10, 11, 12, 13, 1000])
+        self.assertEqual(calculate_median(sketch), 11)
+        lower_bound, upper_bound = iqr_bounds(sketch)
+        self.assertTrue(lower_bound < 9 and 13 < upper_bound < 1000)
+        with self.assertRaises(ValueError):
+            calculate_median(QuantileSketch())
+
+    def test_remove_outliers_with_sketch(self):
+        df = pd.DataFrame({
+            'values': [10, 12, 11, 1000, 13, 9, 10]
+        })
+
+        # Approximate mode still drops the obvious outlier
+        cleaned_df = remove_outliers_iqr(df, columns=['values'], approximate=True)
+        self.assertNotIn(1000, cleaned_df['values'].values)
+
+        # Bounds from a prebuilt sketch are reused instead of recomputed
+        sketch = QuantileSketch().update(df['values'])
+        serving_df = pd.DataFrame({'values': [500, 11]})
+        cleaned_df = remove_outliers_iqr(serving_df, sketches={'values': sketch})
+        self.assertEqual(list(cleaned_df['values']), [11])
+
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import contextlib
+import contextvars
+import numbers
+
+import numpy as np
+
+_enabled = contextvars.ContextVar("validation_enabled", default=True)
+
+
+class ValidatedArray(np.ndarray):
+	"""
+	An ndarray that has already passed check_array. Passing it to another
+	function that validates its input skips the checks. It is a read-only
+	view of the caller's data unless check_array was asked to copy, so
+	the caller must not modify that data while the array is in use.
+	Slices and views stay validated; results of arithmetic are
+	plain arrays again, since they can hold new NaN or infinite values.
+	The allow_nan attribute records whether NaN and infinite values were
+	let through, so a stricter later check still runs.
+	"""
+
+	allow_nan = False
+
+	def __array_finalize__(self, obj):
+		self.allow_nan = getattr(obj, "allow_nan", False)
+
+	def __array_wrap__(self, array, context=None, return_scalar=False):
+		array = array.view(np.ndarray)
+		if return_scalar:
+			return array[()]
+		return array
+
+
+def set_validation(enabled):
+	"""
+	Turns input validation on or off for the current context. Tasks and
+	threads started afterwards inherit the setting.
+	Parameters:
+		enabled: False to skip all checks in trusted production paths
+	"""
+
+	_enabled.set(bool(enabled))
+
+
+def validation_enabled():
+	"""
+	Returns: True if inputs are currently validated
+	"""
+
+	return _enabled.get()
+
+
+@contextlib.contextmanager
+def validation_disabled():
+	"""
+	A context manager that skips input validation inside its block.
+	"""
+
+	token = _enabled.set(False)
+	try:
+		yield
+	finally:
+		_enabled.reset(token)
+
+
+def check_array(x, name="x", ndim=1, allow_nan=False, copy=False):
+	"""
+	Converts x to an array and validates it once, in vectorized form:
+	numeric dtype, dimensionality, non-emptiness and, for floats, no NaN
+	or infinite values. Any integer or float dtype is accepted, including
+	np.float32 and np.int64.
+	Parameters:
+		x: an iterable of numerical values or an ndarray
+		name: the name used in error messages
+		ndim: the required number of dimensions, or None for any
+		allow_nan: True to let NaN and infinite values through
+		copy: True to validate a private copy, so later writes to the
+			caller's ndarray or DataFrame cannot invalidate the checks;
+			by default the result is a read-only view sharing x's memory
+	Returns: x as a read-only ValidatedArray, or as a plain array when
+		validation is disabled (in trusted production paths,
+		validation_disabled() skips both the checks and any copy)
+	"""
+
+	array = np.asarray(x)
+	if not _enabled.get():
+		return array
+
+	# an already validated array (or a slice of one) skips the dtype and
+	# NaN scans, but its size and shape are cheap to check again, and the
+	# NaN scan still runs if it was skipped the first time
+	validated = isinstance(x, ValidatedArray)
+	if array.size == 0:
+		raise ValueError("Empty dataset")
+	if not validated and array.dtype.kind not in "biuf":
+		raise TypeError("All elements must be numerical values")
+	if ndim is not None and array.ndim != ndim:
+		raise ValueError(f"{name} must be {ndim} dimensional")
+	if validated and (allow_nan or not x.allow_nan):
+		return x
+	if not allow_nan and array.dtype.kind == "f" and not np.isfinite(array).all():
+		raise ValueError(f"{name} contains NaN or infinite values")
+	if validated:
+		x = x.view(ValidatedArray)
+		x.allow_nan = False
+		return x
+
+	# lists are already converted into fresh memory; ndarray and pandas
+	# input is only copied on request, to avoid doubling large arrays
+	if copy and (array is x or array.base is not None):
+		array = array.copy()
+	array = array.view(ValidatedArray)
+	array.flags.writeable = False
+	array.allow_nan = allow_nan
+	return array
+
+
+def check_scalar(value, name="value"):
+	"""
+	Checks that value is a single real number, such as an int, float,
+	np.float32 or np.int64.
+	Parameters:
+		value: the value to check
+		name: the name used in error messages
+	"""
+
+	if _enabled.get() and not isinstance(value, numbers.Real):
+		raise TypeError(f"{name} must be a numeric value")